@@ -0,0 +1,261 @@
+# benchmark.py
+"""Replay Dialogflow webhook payloads against the app and report latency.
+
+    python benchmark.py --mode client --requests 2000
+    python benchmark.py --mode server --concurrency 8 --replay captured.jsonl
+    python benchmark.py --output bench_before.json
+
+Payloads are read from a JSONL file of recorded Dialogflow requests
+(one request body per line) or generated to cover every intent in
+INTENT_HANDLERS. The user store is swapped for a throwaway SQLite file
+wrapped in a counter, so runs don't touch real history.
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import user_data
+import webhook
+
+# 每个 intent 的参数组合，用来生成请求
+INTENT_PARAMETERS = {
+    "start.recommendation": [{}],
+    "spicy.preference": [{}, {"spicy_type": "chilli"}, {"spicy_type": "hot"}],
+    "healthy.preference": [{}],
+    "no.preference": [{}, {"food_preference": "none"}, {"food_preference": "none", "weather_type": "cold"},
+                      {"food_preference": "none", "weather_type": "hot"},
+                      {"food_preference": "none", "geo-city": "Seoul"},
+                      {"food_preference": "none", "geo-city": "Bangkok"}],
+    "cold.preference": [{}, {"geo-city": "London"}],
+    "rice.preference": [{}],
+    "pasta.preference": [{}],
+    "fastfood.preference": [{}],
+    "choose.delivery": [{"delivery_option": "delivery", "food_preference": "pasta"},
+                        {"delivery_option": "delivery"}],
+    "choosen.dinein": [{"delivery_option": "dine in", "food_preference": "rice"},
+                       {"delivery_option": "dine in"}],
+    "followup.delivery.option": [{}],
+    "health.goal.recommendation": [{"health_goal": ["lose weight"]}, {"health_goal": ["gain muscle"]},
+                                   {"health_goal": ["stay healthy"]}, {}],
+    "meal.time.recommendation": [{"meal_time": "breakfast"}, {"meal_time": "lunch"},
+                                 {"meal_time": "dinner"}, {}],
+    "personalized.recommendation": [{"food_preference": "healthy"}, {"weather_type": "cold"},
+                                    {"weather_type": "hot"}, {}, {"geo-city": "Beijing"},
+                                    {"location": {"city": "Singapore"}}, {"geo-city": "Tokyo"}],
+    "record.recent.meal": [{"recent_meal": "Ramen"}, {"recent_meal": "Bibimbap"}, {}],
+    "unknown.intent": [{}],
+}
+
+
+class CountingStore:
+    """Wraps a history store and records call counts and time spent."""
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def _timed(self, op, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                stat = self.stats.setdefault(op, {"calls": 0, "seconds": 0.0})
+                stat["calls"] += 1
+                stat["seconds"] += elapsed
+
+    def get(self, user_id):
+        return self._timed("read", self.store.get, user_id)
+
+    def get_versioned(self, user_id):
+        return self._timed("read", self.store.get_versioned, user_id)
+
+    def version(self, user_id):
+        return self._timed("version", self.store.version, user_id)
+
+    def append(self, user_id, events):
+        return self._timed("write", self.store.append, user_id, events)
+
+    def put(self, user_id, history):
+        return self._timed("write", self.store.put, user_id, history)
+
+    def add(self, user_id, meal):
+        return self._timed("write", self.store.add, user_id, meal)
+
+    def user_ids(self):
+        return self.store.user_ids()
+
+    def items(self):
+        return self.store.items()
+
+
+def generate_payloads(count, users, seed=0):
+    rng = random.Random(seed)
+    cases = [(intent, params) for intent, variants in INTENT_PARAMETERS.items() for params in variants]
+    payloads = []
+    for i in range(count):
+        intent, params = cases[i % len(cases)] if i < len(cases) else rng.choice(cases)
+        payloads.append({
+            "session": f"projects/bench/agent/sessions/user-{rng.randrange(users)}",
+            "queryResult": {"intent": {"displayName": intent}, "parameters": params},
+        })
+    return payloads
+
+
+def load_payloads(path, count):
+    with open(path, "r") as f:
+        recorded = [json.loads(line) for line in f if line.strip()]
+    return list(itertools.islice(itertools.cycle(recorded), count))
+
+
+def intent_of(payload):
+    return payload.get("queryResult", {}).get("intent", {}).get("displayName", "")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, wall_seconds):
+    by_intent = {}
+    for intent, seconds in samples:
+        by_intent.setdefault(intent, []).append(seconds)
+    by_intent["ALL"] = [seconds for _, seconds in samples]
+
+    report = {}
+    for intent, values in sorted(by_intent.items()):
+        values.sort()
+        report[intent] = {
+            "count": len(values),
+            "mean_ms": 1000 * sum(values) / len(values),
+            "p50_ms": 1000 * percentile(values, 50),
+            "p95_ms": 1000 * percentile(values, 95),
+            "p99_ms": 1000 * percentile(values, 99),
+        }
+    report["ALL"]["throughput_rps"] = len(samples) / wall_seconds if wall_seconds else 0.0
+    return report
+
+
+def run_client(payloads, concurrency):
+    client = webhook.app.test_client()
+    lock = threading.Lock()
+    samples = []
+
+    def send(payload):
+        start = time.perf_counter()
+        resp = client.post("/webhook", json=payload)
+        elapsed = time.perf_counter() - start
+        assert resp.status_code == 200, resp.status_code
+        with lock:
+            samples.append((intent_of(payload), elapsed))
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        for payload in payloads:
+            send(payload)
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(send, payloads))
+    return samples, time.perf_counter() - start
+
+
+def run_server(payloads, concurrency):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, webhook.app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.port}/webhook"
+    lock = threading.Lock()
+    samples = []
+
+    def send(payload):
+        body = json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        with urllib.request.urlopen(req) as resp:
+            resp.read()
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples.append((intent_of(payload), elapsed))
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max(1, concurrency)) as pool:
+            list(pool.map(send, payloads))
+        wall = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    return samples, wall
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["client", "server", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--replay", help="JSONL file of recorded Dialogflow requests")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING", help="webhook log level during the run")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("webhook").setLevel(args.log_level)
+    if args.replay:
+        payloads = load_payloads(args.replay, args.requests)
+    else:
+        payloads = generate_payloads(args.requests, args.users, args.seed)
+
+    modes = ["client", "server"] if args.mode == "both" else [args.mode]
+    runners = {"client": run_client, "server": run_server}
+    results = {
+        "python": platform.python_version(),
+        "requests": len(payloads),
+        "concurrency": args.concurrency,
+        "source": args.replay or "generated",
+        "modes": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in modes:
+            store = CountingStore(user_data.SQLiteHistoryStore(os.path.join(tmp, f"{mode}.db")))
+            user_data.set_store(store)
+            samples, wall = runners[mode](payloads, args.concurrency)
+            results["modes"][mode] = {
+                "wall_seconds": wall,
+                "intents": summarize(samples, wall),
+                "user_store": store.stats,
+            }
+            overall = results["modes"][mode]["intents"]["ALL"]
+            print(f"{mode:>6}: {overall['throughput_rps']:.0f} req/s  "
+                  f"p50 {overall['p50_ms']:.2f}ms  p95 {overall['p95_ms']:.2f}ms  p99 {overall['p99_ms']:.2f}ms")
+        user_data.set_store(None)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
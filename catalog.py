@@ -0,0 +1,102 @@
+# catalog.py
+import hashlib
+from collections import namedtuple
+
+# 食物推荐数据库
+food_recommendations = {
+    "spicy": {
+        "default": ["Kimchi Stew", "Tteokbokki", "Spicy Fried Chicken"],
+        "chilli": ["Chilli Ramen", "Chilli Chicken Bowl"],
+        "hot": ["Hot Pot", "Spicy Udon"]
+    },
+    "cold": ["Cold Noodles", "Chilled Tofu", "Fresh Salad"],
+    "healthy": ["Grilled Salmon", "Quinoa Salad", "Steamed Vegetables", "Tofu Bowl"],
+    "rice": ["Bibimbap", "Fried Rice", "Omurice", "Curry Rice"],
+    "pasta": ["Spaghetti Bolognese", "Carbonara", "Cream Pasta", "Pesto Pasta"],
+    "fastfood": ["Cheeseburger", "Fried Chicken", "French Fries", "Hot Dog"],
+    "default": ["Ramen", "Sandwich", "Dumplings", "Donburi"],
+    "health_goal": {
+        "lose weight": ["Quinoa Salad", "Steamed Vegetables", "Tofu Bowl"],
+        "gain muscle": ["Grilled Chicken", "Beef Bowl", "Protein Pasta"],
+        "stay healthy": ["Grilled Salmon", "Avocado Salad", "Vegetable Soup"]
+    },
+    "meal_time": {
+        "breakfast": ["Toast", "Omelette", "Yogurt Bowl", "Egg Sandwich", "Porridge", "Avocado Toast"],
+        "lunch": ["Bibimbap", "Curry Rice", "Chicken Salad", "Ramen"],
+        "dinner": ["Salmon Bowl", "Udon", "Grilled Vegetables", "Spaghetti", "Grilled Fish"]
+    }
+}
+
+Dish = namedtuple("Dish", ["id", "name", "tags"])
+
+# 这些顶层分类靠别的参数选（health_goal / meal_time），不能当 food_preference
+PARAMETER_CATEGORIES = ("health_goal", "meal_time")
+
+
+class Catalog:
+    """Dish records with integer IDs, compiled from the nested recommendation dict.
+
+    Each category is stored as a tuple of dish IDs in source order. Nested
+    categories are keyed as "parent:child" (e.g. "spicy:chilli"); the bare
+    parent key resolves to its "default" child, or to all children when it
+    has none. Dishes that appear in several categories share one ID and
+    carry every category as a tag. `preferences` are the top-level keys a
+    user can ask for as a food preference.
+    """
+
+    def __init__(self, tree):
+        self.dishes = []
+        self.by_name = {}
+        self.categories = {}
+        self.preferences = frozenset(key for key in tree if key not in PARAMETER_CATEGORIES)
+        for key, value in tree.items():
+            if isinstance(value, dict):
+                union = []
+                for sub, names in value.items():
+                    ids = self._add_category(f"{key}:{sub}", names, parent=key)
+                    union.extend(i for i in ids if i not in union)
+                default = self.categories.get(f"{key}:default")
+                self.categories[key] = default if default is not None else tuple(union)
+            else:
+                self._add_category(key, value)
+        self.dishes = [Dish(d.id, d.name, frozenset(d.tags)) for d in self.dishes]
+
+    def _add_category(self, key, names, parent=None):
+        ids = []
+        for name in names:
+            dish_id = self.by_name.get(name.lower())
+            if dish_id is None:
+                dish_id = len(self.dishes)
+                self.by_name[name.lower()] = dish_id
+                self.dishes.append(Dish(dish_id, name, set()))
+            self.dishes[dish_id].tags.add(key)
+            if parent:
+                self.dishes[dish_id].tags.add(parent)
+            ids.append(dish_id)
+        self.categories[key] = tuple(ids)
+        return self.categories[key]
+
+    def __contains__(self, key):
+        return key in self.categories
+
+    def __len__(self):
+        return len(self.dishes)
+
+    def ids(self, key):
+        return self.categories[key]
+
+    def name(self, dish_id):
+        return self.dishes[dish_id].name
+
+    def lookup(self, name):
+        return self.by_name.get(name.strip().lower())
+
+    def fingerprint(self):
+        # 菜品或分类变了，预计算结果就作废
+        h = hashlib.sha1()
+        for dish in self.dishes:
+            h.update(f"{dish.id}:{dish.name}:{','.join(sorted(dish.tags))}\n".encode("utf-8"))
+        return h.hexdigest()[:16]
+
+
+catalog = Catalog(food_recommendations)
@@ -0,0 +1,82 @@
+# history.py
+"""Per-user meal history as a fixed-size ring buffer of timestamped events.
+
+Each event is a catalog dish ID and a Unix timestamp (8 bytes), so a user
+costs at most HISTORY_CAPACITY * 8 bytes no matter how long they've used
+the bot. Adding a meal is O(1). `decay_vector` turns the events into an
+exponentially time-decayed eat count per dish: a dish eaten just now
+scores 1.0, half that after HISTORY_HALF_LIFE, and a dish eaten every day
+piles up a higher score than one eaten once.
+"""
+import math
+import os
+import time
+
+import numpy as np
+
+HISTORY_CAPACITY = int(os.environ.get("HISTORY_CAPACITY", 64))
+HISTORY_HALF_LIFE = float(os.environ.get("HISTORY_HALF_LIFE", 2 * 24 * 3600))
+# 衰减分数高于这个值就算“最近吃过”，不再推荐
+AVOID_THRESHOLD = 0.25
+
+EVENT_DTYPE = np.dtype([("dish", "<i4"), ("ts", "<u4")])
+
+
+class MealHistory:
+    __slots__ = ("capacity", "events", "head", "count")
+
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        self.capacity = capacity
+        self.events = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self.head = 0   # 下一个写入位置
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, dish_id, ts=None):
+        self.events[self.head] = (dish_id, int(time.time() if ts is None else ts))
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def chronological(self):
+        """Events oldest first."""
+        if self.count < self.capacity:
+            return self.events[:self.count]
+        return np.roll(self.events, -self.head)
+
+    def decay_vector(self, n_dishes, now=None, half_life=HISTORY_HALF_LIFE):
+        events = self.events[:self.count]
+        now = time.time() if now is None else now
+        ages = np.maximum(now - events["ts"].astype(np.float64), 0.0)
+        weights = np.exp(-math.log(2) * ages / half_life)
+        return np.bincount(events["dish"], weights=weights, minlength=n_dishes).astype(np.float32)
+
+    def recent_ids(self, limit):
+        """Distinct dish IDs, most recent last, at most `limit` of them."""
+        seen = []
+        for dish_id in self.chronological()["dish"][::-1]:
+            if dish_id not in seen:
+                seen.append(int(dish_id))
+                if len(seen) == limit:
+                    break
+        return seen[::-1]
+
+    def to_bytes(self):
+        return self.chronological().tobytes()
+
+    @classmethod
+    def from_events(cls, events, capacity=HISTORY_CAPACITY):
+        history = cls(capacity)
+        for dish_id, ts in list(events)[-capacity:]:
+            history.add(dish_id, ts)
+        return history
+
+    @classmethod
+    def from_bytes(cls, data, capacity=HISTORY_CAPACITY):
+        events = np.frombuffer(data, dtype=EVENT_DTYPE)[-capacity:]
+        history = cls(capacity)
+        history.events[:len(events)] = events
+        history.count = len(events)
+        history.head = len(events) % capacity
+        return history
@@ -0,0 +1,161 @@
+# images.py
+"""Dish image manifest, pre-sized variants and an in-memory byte cache.
+
+At startup every catalog dish is matched to `picture/<slug>.jpg`. Each
+found image gets resized, recompressed JPEG variants (when Pillow is
+installed), stored under IMAGE_CACHE_DIR and named by content hash, so
+their URLs never change meaning and can be cached as immutable. Dishes
+without a picture point at a built-in placeholder.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import metrics
+
+try:
+    from PIL import Image
+except ImportError:  # 没装 Pillow 时只提供原图
+    Image = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PICTURE_DIR = os.environ.get("PICTURE_DIR", os.path.join(BASE_DIR, "picture"))
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", os.path.join(BASE_DIR, "picture_cache"))
+IMAGE_CACHE_BYTES = int(os.environ.get("IMAGE_CACHE_BYTES", 32 * 1024 * 1024))
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "https://food-recommender-bot.onrender.com")
+VARIANT_WIDTHS = {"small": 320, "medium": 640}
+DEFAULT_VARIANT = "medium"
+JPEG_QUALITY = 80
+
+PLACEHOLDER_NAME = "placeholder.svg"
+PLACEHOLDER_SVG = (
+    b'<svg xmlns="http://www.w3.org/2000/svg" width="640" height="640" viewBox="0 0 640 640">'
+    b'<rect width="640" height="640" fill="#f2efe9"/>'
+    b'<circle cx="320" cy="330" r="150" fill="none" stroke="#c9c2b6" stroke-width="16"/>'
+    b'<circle cx="320" cy="330" r="95" fill="none" stroke="#c9c2b6" stroke-width="8"/>'
+    b'<text x="320" y="560" font-family="sans-serif" font-size="36" fill="#9c9486" '
+    b'text-anchor="middle">No picture yet</text></svg>'
+)
+
+Asset = namedtuple("Asset", ["filename", "path", "etag", "mimetype", "size", "immutable"])
+
+
+def slugify(name):
+    return name.lower().replace(" ", "_")
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+class ByteCache:
+    """LRU of file contents bounded by total size in bytes."""
+
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class ImageStore:
+    def __init__(self, catalog, picture_dir=PICTURE_DIR, cache_dir=IMAGE_CACHE_DIR,
+                 cache_bytes=IMAGE_CACHE_BYTES, base_url=PUBLIC_BASE_URL):
+        self.catalog = catalog
+        self.picture_dir = picture_dir
+        self.cache_dir = cache_dir
+        self.base_url = base_url.rstrip("/")
+        self.bytes = ByteCache(cache_bytes)
+        self.assets = {}    # filename -> Asset
+        self.builtin = {}   # filename -> bytes for assets with no file on disk
+        self.manifest = {}  # dish id -> {variant: filename}
+        self._add_asset(PLACEHOLDER_NAME, None, PLACEHOLDER_SVG, "image/svg+xml", immutable=False)
+        self.build()
+
+    def _add_asset(self, filename, path, data, mimetype, immutable=True):
+        asset = Asset(filename, path, _digest(data), mimetype, len(data), immutable)
+        self.assets[filename] = asset
+        if path is None:
+            self.builtin[filename] = data
+        return asset
+
+    def build(self):
+        for dish in self.catalog.dishes:
+            slug = slugify(dish.name)
+            path = os.path.join(self.picture_dir, f"{slug}.jpg")
+            if not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = _digest(data)
+            variants = {"original": self._add_asset(f"{slug}.{digest}.jpg", path, data, "image/jpeg").filename}
+            # 兼容旧链接 /picture/<slug>.jpg
+            self._add_asset(f"{slug}.jpg", path, data, "image/jpeg", immutable=False)
+            if Image is not None:
+                for variant, width in VARIANT_WIDTHS.items():
+                    variants[variant] = self._build_variant(slug, digest, path, width)
+            self.manifest[dish.id] = variants
+
+    def _build_variant(self, slug, digest, path, width):
+        # 缓存文件名带原图哈希，原图变了会自动重新生成
+        cached = os.path.join(self.cache_dir, f"{slug}.{digest}.w{width}.jpg")
+        if not os.path.isfile(cached):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with Image.open(path) as im:
+                im = im.convert("RGB")
+                if im.width > width:
+                    im = im.resize((width, round(im.height * width / im.width)), Image.LANCZOS)
+                buf = io.BytesIO()
+                im.save(buf, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            tmp = f"{cached}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(buf.getvalue())
+            os.replace(tmp, cached)
+        with open(cached, "rb") as f:
+            data = f.read()
+        return self._add_asset(f"{slug}@{width}.{_digest(data)}.jpg", cached, data, "image/jpeg").filename
+
+    def filename(self, dish_name, variant=DEFAULT_VARIANT):
+        dish_id = self.catalog.lookup(dish_name)
+        variants = self.manifest.get(dish_id)
+        if not variants:
+            return PLACEHOLDER_NAME
+        return variants.get(variant) or variants["original"]
+
+    def url(self, dish_name, variant=DEFAULT_VARIANT):
+        return f"{self.base_url}/picture/{self.filename(dish_name, variant)}"
+
+    def get(self, filename):
+        """Return (asset, bytes) or (None, None) for unknown files."""
+        asset = self.assets.get(filename)
+        if asset is None:
+            return None, None
+        data = self.builtin.get(filename) or self.bytes.get(filename)
+        metrics.image_cache_total.inc("miss" if data is None else "hit")
+        if data is None:
+            with open(asset.path, "rb") as f:
+                data = f.read()
+            self.bytes.put(filename, data)
+        return asset, data
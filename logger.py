@@ -0,0 +1,93 @@
+# logger.py
+"""Structured JSON logging that never blocks the request thread.
+
+Records go onto an in-memory queue and a background QueueListener thread
+formats and writes them. Per-intent sampling keeps busy intents from
+flooding the log, e.g.
+
+    LOG_SAMPLE_RATES="default=0.1,record.recent.meal=1"
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import traceback
+
+
+def parse_sample_rates(spec):
+    rates = {"default": 1.0}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class IntentSampler(logging.Filter):
+    """Keeps a fraction of INFO records per intent; warnings and errors always pass."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        intent = getattr(record, "fields", {}).get("intent", "default")
+        rate = self.rates.get(intent, self.rates["default"])
+        return rate >= 1.0 or random.random() < rate
+
+
+_handler = None
+
+
+def _queue_handler():
+    global _handler
+    if _handler is None:
+        log_queue = queue.SimpleQueue()
+        _handler = logging.handlers.QueueHandler(log_queue)
+        _handler.addFilter(IntentSampler(parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES", ""))))
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter())
+        listener = logging.handlers.QueueListener(log_queue, output)
+        listener.start()
+        atexit.register(listener.stop)
+    return _handler
+
+
+def get_logger(name="webhook"):
+    logger = logging.getLogger(name)
+    handler = _queue_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+        logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+        logger.propagate = False
+    return logger
+
+
+def log_event(logger, msg, level=logging.INFO, exc=None, **fields):
+    if logger.isEnabledFor(level):
+        if exc is not None:
+            # QueueHandler 入队前会丢掉 exc_info，所以在这里就把 traceback 转成字符串
+            fields["exc"] = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        logger.log(level, msg, extra={"fields": fields})
+
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 3)
@@ -0,0 +1,103 @@
+# metrics.py
+"""In-process counters and histograms rendered in Prometheus text format."""
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    le = _labels(self.label_names + ("le",), labels + (bound,))
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+requests_total = register(Counter(
+    "webhook_requests_total", "Webhook requests by intent and outcome.", ("intent", "status")))
+request_seconds = register(Histogram(
+    "webhook_request_seconds", "Webhook handling time by intent.", ("intent",)))
+user_store_seconds = register(Histogram(
+    "user_store_seconds", "User history store call time by operation.", ("op",)))
+session_cache_total = register(Counter(
+    "session_cache_total", "User session cache lookups by result.", ("result",)))
+image_cache_total = register(Counter(
+    "image_cache_total", "Image byte cache lookups by result.", ("result",)))
+weather_lookup_total = register(Counter(
+    "weather_lookup_total", "Weather lookups by result.", ("result",)))
+precompute_lookup_total = register(Counter(
+    "precompute_lookup_total", "Precomputed recommendation lookups by result.", ("result",)))
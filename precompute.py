@@ -0,0 +1,251 @@
+# precompute.py
+"""Offline precomputation of next-meal recommendations for every user.
+
+    python precompute.py --output recommendations.bin --workers 4
+
+Reads every user from the history store, ranks their top dishes for the
+common category/parameter combinations in a process pool, and writes one
+binary file that the webhook memory-maps. File layout:
+
+    MAGIC | header length (uint32) | header JSON | padding to 8 bytes
+    user key hashes       uint64[users]           (sorted)
+    history fingerprints  uint32[users]
+    results               int32[users, combos, k] (-1 = no dish)
+
+An entry is used only while the user's history still matches its
+fingerprint and the catalog/ranker settings match the header; anything
+else falls back to live ranking. Decay scores are taken at build time,
+so PRECOMPUTE_MAX_AGE also bounds how far they can drift.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import metrics
+import ranking
+import user_data
+from catalog import catalog
+from history import HISTORY_HALF_LIFE, MealHistory
+from ranking import ranker
+
+PRECOMPUTE_FILE = os.environ.get("PRECOMPUTE_FILE", "recommendations.bin")
+PRECOMPUTE_MAX_AGE = float(os.environ.get("PRECOMPUTE_MAX_AGE", 24 * 3600))
+RELOAD_INTERVAL = 30.0
+MAGIC = b"FRBPRE1\n"
+TOP_K = 3
+CHUNK_SIZE = 500
+WEATHERS = ("", "cold", "hot")
+
+
+def ranker_version():
+    settings = {
+        "catalog": catalog.fingerprint(),
+        "weights": ranking.SIGNAL_WEIGHTS,
+        "weather": ranking.WEATHER_TAGS,
+        "recency": ranking.RECENCY_PENALTY,
+        "avoid": ranking.AVOID_THRESHOLD,
+        "half_life": HISTORY_HALF_LIFE,
+        "tiebreak": ranking.TIEBREAK_SCALE,
+        "k": TOP_K,
+    }
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def combo_key(category, signals):
+    return category + "|" + ";".join(f"{tag}={signals[tag]:g}" for tag in sorted(signals))
+
+
+def common_combos():
+    """(category, signals) pairs the intent handlers commonly ask for.
+
+    Each category is asked for either with no parameter of its own (e.g.
+    cold.preference -> spicy:default) or with the parameter that picked it
+    (food_pref=rice, spicy_type=chilli, ...), each with and without weather.
+    """
+    combos = {}
+    for category in catalog.categories:
+        parent, _, child = category.partition(":")
+        if not child:
+            own = {"food_pref": category}
+        elif parent == "spicy":
+            own = {"spicy_type": child}
+        else:
+            own = {parent: child}
+        for params in ({}, own):
+            for weather in WEATHERS:
+                signals = ranker.signals(dict(params, weather=weather))
+                combos.setdefault(combo_key(category, signals), (category, signals))
+    return [combos[key] for key in sorted(combos)]
+
+
+def user_key(user_id):
+    return int.from_bytes(hashlib.blake2b(user_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def history_fingerprint(history):
+    return zlib.crc32(history.to_bytes())
+
+
+def _rank_chunk(users, now):
+    # 在子进程里跑：一批用户 × 所有组合，一次矩阵运算
+    combos = common_combos()
+    categories, signals, recents, user_ids = [], [], [], []
+    for user_id, events in users:
+        decay = MealHistory.from_bytes(events).decay_vector(len(catalog), now)
+        for category, combo_signals in combos:
+            categories.append(category)
+            signals.append(combo_signals)
+            recents.append(decay)
+            user_ids.append(user_id)
+    top = ranker.top_k_batch(categories, signals, recents, user_ids, k=TOP_K)
+    out = np.full((len(users), len(combos), TOP_K), -1, dtype=np.int32)
+    for row, ids in enumerate(top):
+        out[row // len(combos), row % len(combos), :len(ids)] = ids
+    return out
+
+
+def build(store, output=PRECOMPUTE_FILE, workers=None, chunk_size=CHUNK_SIZE):
+    users = list(store.items())
+    combos = common_combos()
+    keys = np.array([user_key(user_id) for user_id, _ in users], dtype=np.uint64)
+    order = np.argsort(keys, kind="stable")
+    users = [users[i] for i in order]
+    keys = keys[order]
+    fingerprints = np.array([history_fingerprint(history) for _, history in users], dtype=np.uint32)
+
+    # 传给子进程的是紧凑的事件字节，不是对象
+    packed = [(user_id, history.to_bytes()) for user_id, history in users]
+    chunks = [packed[i:i + chunk_size] for i in range(0, len(packed), chunk_size)]
+    results = np.full((len(users), len(combos), TOP_K), -1, dtype=np.int32)
+    now = time.time()
+    if chunks:
+        with ProcessPoolExecutor(workers) as pool:
+            for i, part in enumerate(pool.map(_rank_chunk, chunks, [now] * len(chunks))):
+                results[i * chunk_size:i * chunk_size + len(part)] = part
+
+    header = json.dumps({
+        "version": ranker_version(),
+        "created": time.time(),
+        "users": len(users),
+        "k": TOP_K,
+        "combos": [combo_key(c, s) for c, s in combos],
+    }).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % 8)
+
+    tmp = f"{output}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(prefix)
+        f.write(keys.tobytes())
+        f.write(fingerprints.tobytes())
+        f.write(results.tobytes())
+    os.replace(tmp, output)  # 原子替换，在线进程不会读到半个文件
+    return len(users), len(combos)
+
+
+class PrecomputedRecommendations:
+    """Read-only view of a precompute file, memory-mapped."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a precompute file")
+        (header_len,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._mm[start:start + header_len].decode("utf-8"))
+        offset = start + header_len
+        offset += -offset % 8
+        n, k = self.header["users"], self.header["k"]
+        self.combos = {key: i for i, key in enumerate(self.header["combos"])}
+        self.keys = np.frombuffer(self._mm, dtype=np.uint64, count=n, offset=offset)
+        offset += 8 * n
+        self.fingerprints = np.frombuffer(self._mm, dtype=np.uint32, count=n, offset=offset)
+        offset += 4 * n
+        self.results = np.frombuffer(self._mm, dtype=np.int32, count=n * len(self.combos) * k,
+                                     offset=offset).reshape(n, len(self.combos), k)
+
+    def is_current(self):
+        return (self.header["version"] == ranker_version()
+                and time.time() - self.header["created"] < PRECOMPUTE_MAX_AGE)
+
+    def lookup(self, user_id, history, category, signals):
+        """Return the precomputed top dish IDs, or None on a miss or stale entry."""
+        column = self.combos.get(combo_key(category, signals))
+        if column is None:
+            return None
+        key = np.uint64(user_key(user_id))
+        row = int(np.searchsorted(self.keys, key))
+        if row >= len(self.keys) or self.keys[row] != key:
+            return None
+        if self.fingerprints[row] != history_fingerprint(history):
+            return None
+        return [int(i) for i in self.results[row, column] if i >= 0]
+
+
+class Precomputed:
+    """Holds the current precompute file and picks up new ones written by the batch job."""
+
+    def __init__(self, path=PRECOMPUTE_FILE):
+        self.path = path
+        self.current = None
+        self._mtime = None
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked < RELOAD_INTERVAL:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                self.current, self._mtime = None, None
+                return
+            if mtime != self._mtime:
+                self._mtime = mtime
+                try:
+                    self.current = PrecomputedRecommendations(self.path)
+                except (ValueError, OSError):
+                    self.current = None
+            if self.current is not None and not self.current.is_current():
+                self.current = None
+
+    def lookup(self, user_id, history, category, signals):
+        self._refresh()
+        table = self.current
+        ids = table.lookup(user_id, history, category, signals) if table is not None else None
+        metrics.precompute_lookup_total.inc("miss" if ids is None else "hit")
+        return ids
+
+
+precomputed = Precomputed()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute next-meal recommendations for all users.")
+    parser.add_argument("--output", default=PRECOMPUTE_FILE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    users, combos = build(user_data.get_store(), args.output, args.workers, args.chunk_size)
+    print(f"Precomputed {users} users x {combos} combinations in "
+          f"{time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
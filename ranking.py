@@ -0,0 +1,135 @@
+# ranking.py
+import zlib
+
+import numpy as np
+
+from catalog import catalog as default_catalog
+from history import AVOID_THRESHOLD
+
+# 各信号对应标签的权重
+SIGNAL_WEIGHTS = {
+    "food_pref": 1.0,
+    "spicy_type": 1.0,
+    "health_goal": 1.0,
+    "meal_time": 1.0,
+    "weather": 0.5,
+}
+WEATHER_TAGS = {"cold": "spicy", "hot": "cold"}
+RECENCY_PENALTY = 4.0
+TIEBREAK_SCALE = 0.01
+
+
+class Ranker:
+    """Scores dishes with a dish x tag matrix built from the catalog.
+
+    A request becomes a preference vector over tags; a dish's score is
+    features @ preference, minus a penalty proportional to the user's
+    time-decayed eat count for that dish, plus a small per-user tiebreak
+    so users asking for the same category don't all get the same dish.
+    Candidates are limited to the requested category, and dishes whose
+    decay score is at or above AVOID_THRESHOLD are left out entirely.
+
+    `recent` is either a decay vector (one float per dish, see
+    history.MealHistory.decay_vector) or a plain list of dish names, which
+    counts each as just eaten.
+    """
+
+    def __init__(self, catalog=default_catalog, recency_penalty=RECENCY_PENALTY):
+        self.catalog = catalog
+        self.recency_penalty = recency_penalty
+        self.tags = sorted({tag for dish in catalog.dishes for tag in dish.tags})
+        self.tag_index = {tag: i for i, tag in enumerate(self.tags)}
+        self.features = np.zeros((len(catalog.dishes), len(self.tags)), dtype=np.float32)
+        for dish in catalog.dishes:
+            self.features[dish.id, [self.tag_index[t] for t in dish.tags]] = 1.0
+        self._category_masks = {}
+
+    def signals(self, p):
+        """Map parsed webhook parameters to {tag: weight}."""
+        p = p or {}
+        signals = {}
+
+        def add(tag, weight):
+            if tag in self.tag_index:
+                signals[tag] = signals.get(tag, 0.0) + weight
+
+        if p.get("food_pref"):
+            add(p["food_pref"], SIGNAL_WEIGHTS["food_pref"])
+        if p.get("spicy_type"):
+            add(f"spicy:{p['spicy_type']}", SIGNAL_WEIGHTS["spicy_type"])
+        if p.get("health_goal"):
+            add(f"health_goal:{p['health_goal']}", SIGNAL_WEIGHTS["health_goal"])
+        if p.get("meal_time"):
+            add(f"meal_time:{p['meal_time']}", SIGNAL_WEIGHTS["meal_time"])
+        if p.get("weather") in WEATHER_TAGS:
+            add(WEATHER_TAGS[p["weather"]], SIGNAL_WEIGHTS["weather"])
+        return signals
+
+    def preference_vector(self, signals):
+        vec = np.zeros(len(self.tags), dtype=np.float32)
+        for tag, weight in signals.items():
+            vec[self.tag_index[tag]] = weight
+        return vec
+
+    def recency_vector(self, recent):
+        if isinstance(recent, np.ndarray):
+            return recent
+        vec = np.zeros(len(self.catalog.dishes), dtype=np.float32)
+        for name in recent:
+            dish_id = self.catalog.lookup(name)
+            if dish_id is not None:
+                vec[dish_id] = 1.0
+        return vec
+
+    def category_mask(self, category):
+        mask = self._category_masks.get(category)
+        if mask is None:
+            mask = np.zeros(len(self.catalog.dishes), dtype=bool)
+            mask[list(self.catalog.ids(category))] = True
+            self._category_masks[category] = mask
+        return mask
+
+    def tiebreak(self, user_id):
+        seed = zlib.crc32(user_id.encode("utf-8"))
+        return np.random.default_rng(seed).random(len(self.catalog.dishes), dtype=np.float32) * TIEBREAK_SCALE
+
+    def score(self, category, signals, recent, user_id=""):
+        recency = self.recency_vector(recent)
+        scores = self.features @ self.preference_vector(signals)
+        scores -= self.recency_penalty * recency
+        scores += self.tiebreak(user_id)
+        return np.where(self.category_mask(category) & (recency < AVOID_THRESHOLD), scores, -np.inf)
+
+    def top_k(self, category, signals, recent, k=3, user_id=""):
+        return self._top_k(self.score(category, signals, recent, user_id)[None, :], k)[0]
+
+    def score_batch(self, categories, signals, recents, user_ids):
+        """Score many requests at once; returns a (requests x dishes) matrix."""
+        prefs = np.stack([self.preference_vector(s) for s in signals])
+        recency = np.stack([self.recency_vector(r) for r in recents])  # 按位置一一对应，只遍历一次
+        user_ids = list(user_ids)
+        # 同一用户的多行只算一次 tiebreak
+        tiebreak_rows = {}
+        for user_id in user_ids:
+            if user_id not in tiebreak_rows:
+                tiebreak_rows[user_id] = self.tiebreak(user_id)
+        scores = prefs @ self.features.T
+        scores -= self.recency_penalty * recency
+        scores += np.stack([tiebreak_rows[u] for u in user_ids])
+        masks = np.stack([self.category_mask(c) for c in categories]) & (recency < AVOID_THRESHOLD)
+        return np.where(masks, scores, -np.inf)
+
+    def top_k_batch(self, categories, signals, recents, user_ids, k=3):
+        return self._top_k(self.score_batch(categories, signals, recents, user_ids), k)
+
+    @staticmethod
+    def _top_k(scores, k):
+        k = min(k, scores.shape[1])
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+        top = np.take_along_axis(part, order, axis=1)
+        finite = np.isfinite(np.take_along_axis(scores, top, axis=1))
+        return [row[ok].tolist() for row, ok in zip(top, finite)]
+
+
+ranker = Ranker()
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_data  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = user_data.SQLiteHistoryStore(str(tmp_path / "user_data.db"))
+    user_data.set_store(store)
+    yield store
+    user_data.set_store(None)
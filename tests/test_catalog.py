@@ -0,0 +1,44 @@
+from catalog import Catalog, catalog
+
+TREE = {
+    "spicy": {"default": ["Kimchi Stew"], "hot": ["Hot Pot", "Kimchi Stew"]},
+    "health_goal": {"lose weight": ["Salad"], "gain muscle": ["Beef Bowl"]},
+    "rice": ["Bibimbap", "Beef Bowl"],
+}
+
+
+def test_ids_follow_first_appearance():
+    small = Catalog(TREE)
+    assert [d.name for d in small.dishes] == ["Kimchi Stew", "Hot Pot", "Salad", "Beef Bowl", "Bibimbap"]
+    assert [d.id for d in small.dishes] == list(range(5))
+    assert small.lookup(" kimchi STEW ") == 0
+    assert small.lookup("Pizza") is None
+    assert small.name(3) == "Beef Bowl"
+
+
+def test_parent_resolves_to_default_or_union():
+    small = Catalog(TREE)
+    assert small.ids("spicy") == small.ids("spicy:default") == (0,)
+    assert small.ids("spicy:hot") == (1, 0)
+    assert small.ids("health_goal") == (2, 3)
+    assert "spicy:hot" in small and "spicy:mild" not in small
+
+
+def test_shared_dishes_carry_every_tag():
+    small = Catalog(TREE)
+    assert small.dishes[0].tags == {"spicy", "spicy:default", "spicy:hot"}
+    assert small.dishes[3].tags == {"health_goal", "health_goal:gain muscle", "rice"}
+    assert len(small) == 5
+
+
+def test_preferences_exclude_parameter_categories():
+    assert Catalog(TREE).preferences == {"spicy", "rice"}
+    assert "health_goal" not in catalog.preferences and "meal_time" not in catalog.preferences
+    assert "spicy:chilli" not in catalog.preferences
+    assert {"spicy", "healthy", "rice", "pasta", "fastfood", "cold", "default"} <= catalog.preferences
+
+
+def test_fingerprint_tracks_contents():
+    assert Catalog(TREE).fingerprint() == Catalog(TREE).fingerprint()
+    changed = dict(TREE, rice=["Bibimbap"])
+    assert Catalog(changed).fingerprint() != Catalog(TREE).fingerprint()
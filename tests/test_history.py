@@ -0,0 +1,36 @@
+import numpy as np
+
+from history import EVENT_DTYPE, HISTORY_HALF_LIFE, MealHistory
+
+
+def test_wraps_around_keeping_newest():
+    history = MealHistory(capacity=4)
+    for i in range(10):
+        history.add(i, 1000 + i)
+    assert len(history) == 4
+    assert history.chronological()["dish"].tolist() == [6, 7, 8, 9]
+    assert history.recent_ids(2) == [8, 9]
+
+
+def test_bytes_round_trip_after_wrap():
+    history = MealHistory(capacity=4)
+    for i in range(6):
+        history.add(i, 1000 + i)
+    restored = MealHistory.from_bytes(history.to_bytes(), capacity=4)
+    assert restored.chronological().tolist() == history.chronological().tolist()
+    restored.add(42, 2000)
+    assert restored.chronological()["dish"].tolist() == [3, 4, 5, 42]
+
+
+def test_from_bytes_keeps_last_capacity_events():
+    events = np.array([(i, 1000 + i) for i in range(10)], dtype=EVENT_DTYPE)
+    history = MealHistory.from_bytes(events.tobytes(), capacity=3)
+    assert history.chronological()["dish"].tolist() == [7, 8, 9]
+    assert len(MealHistory.from_bytes(b"")) == 0
+
+
+def test_decay_vector_halves_per_half_life():
+    now = 10 * HISTORY_HALF_LIFE
+    history = MealHistory.from_events([(0, now), (1, now - HISTORY_HALF_LIFE), (1, now)])
+    decay = history.decay_vector(3, now)
+    assert np.allclose(decay, [1.0, 1.5, 0.0])
@@ -0,0 +1,78 @@
+import hashlib
+import io
+
+import pytest
+
+import images
+from catalog import Catalog
+from images import PLACEHOLDER_NAME, ByteCache, ImageStore
+
+TREE = {"rice": ["Bibimbap", "Fried Rice"]}
+
+
+def jpeg_bytes(width=800, height=600):
+    if images.Image is None:
+        return b"\xff\xd8not really a jpeg\xff\xd9"  # 没有 Pillow 时只用到原图
+    buf = io.BytesIO()
+    images.Image.new("RGB", (width, height), (200, 120, 40)).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    pictures = tmp_path / "picture"
+    pictures.mkdir()
+    (pictures / "bibimbap.jpg").write_bytes(jpeg_bytes())
+    return ImageStore(Catalog(TREE), picture_dir=str(pictures), cache_dir=str(tmp_path / "cache"),
+                      base_url="https://example.com/")
+
+
+def test_byte_cache_evicts_least_recently_used():
+    cache = ByteCache(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"  # a 变成最近使用
+    cache.put("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234" and cache.get("c") == b"1234"
+    assert cache.size == 8
+
+
+def test_byte_cache_skips_oversized_and_replaces():
+    cache = ByteCache(max_bytes=10)
+    cache.put("big", b"x" * 11)
+    assert cache.get("big") is None and cache.size == 0
+    cache.put("a", b"12")
+    cache.put("a", b"123456")
+    assert cache.size == 6
+
+
+def test_manifest_names_are_content_addressed(store, tmp_path):
+    data = (tmp_path / "picture" / "bibimbap.jpg").read_bytes()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    variants = store.manifest[0]
+    assert variants["original"] == f"bibimbap.{digest}.jpg"
+    assert store.assets[variants["original"]].immutable
+    assert not store.assets["bibimbap.jpg"].immutable  # 旧链接仍可用
+    if images.Image is not None:
+        assert set(variants) == {"original", "small", "medium"}
+        assert variants["small"].startswith("bibimbap@320.") and variants["small"].endswith(".jpg")
+        assert store.filename("Bibimbap") == variants["medium"]
+        with images.Image.open(store.assets[variants["small"]].path) as im:
+            assert im.width == 320
+    assert store.url("Bibimbap", "original") == f"https://example.com/picture/bibimbap.{digest}.jpg"
+
+
+def test_missing_picture_uses_placeholder(store):
+    assert store.filename("Fried Rice") == PLACEHOLDER_NAME
+    assert store.filename("Pizza") == PLACEHOLDER_NAME
+    asset, data = store.get(PLACEHOLDER_NAME)
+    assert asset.mimetype == "image/svg+xml" and not asset.immutable
+    assert data.startswith(b"<svg")
+
+
+def test_get_reads_once_then_serves_from_cache(store):
+    filename = store.manifest[0]["original"]
+    asset, data = store.get(filename)
+    assert store.bytes.get(filename) == data and asset.size == len(data)
+    assert store.get("nope.jpg") == (None, None)
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+from flask import g
+
+import metrics
+import precompute
+import webhook
+from benchmark import INTENT_PARAMETERS
+from history import MealHistory
+from user_data import UserSession
+
+CASES = [(intent, params) for intent, variants in INTENT_PARAMETERS.items() for params in variants]
+
+
+@pytest.fixture
+def table(store, tmp_path, monkeypatch):
+    now = int(time.time())
+    store.put("alice", MealHistory.from_events([(0, now - 3 * 86400), (5, now - 86400)]))
+    store.put("bob", MealHistory())
+    path = str(tmp_path / "recommendations.bin")
+    precompute.build(store, path, workers=1)
+    holder = precompute.Precomputed(path)
+    monkeypatch.setattr(webhook, "precomputed", holder)
+    return holder
+
+
+@pytest.mark.parametrize("intent,params", CASES, ids=[f"{i}-{n}" for i, (_, n) in enumerate(CASES)])
+@pytest.mark.parametrize("user_id", ["alice", "bob"])
+def test_every_handler_path_hits(table, store, user_id, intent, params):
+    misses = metrics.precompute_lookup_total.value("miss")
+    p = webhook.parse_parameters(intent, params, user_id)
+    user = UserSession(user_id, store.get(user_id))
+    with webhook.app.app_context():
+        g.params = p
+        webhook.INTENT_HANDLERS.get(intent, webhook.handle_unknown)(p, user)
+    assert metrics.precompute_lookup_total.value("miss") == misses
+
+
+def test_lookup_matches_live_ranking(table, store):
+    history = store.get("alice")
+    decay = history.decay_vector(len(precompute.catalog), time.time())
+    for category, signals in precompute.common_combos():
+        expected = precompute.ranker.top_k(category, signals, decay, k=precompute.TOP_K, user_id="alice")
+        assert table.lookup("alice", history, category, signals) == expected
+
+
+def test_changed_history_misses(table, store):
+    history = store.get("alice")
+    history.add(1)
+    assert table.lookup("alice", history, "default", {}) is None
+    assert table.lookup("carol", MealHistory(), "default", {}) is None
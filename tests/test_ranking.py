@@ -0,0 +1,59 @@
+import numpy as np
+
+from catalog import catalog
+from history import AVOID_THRESHOLD
+from ranking import SIGNAL_WEIGHTS, TIEBREAK_SCALE, Ranker, ranker
+
+
+def test_signals_map_parameters_to_tags():
+    p = {"food_pref": "healthy", "spicy_type": "chilli", "health_goal": "lose weight",
+         "meal_time": "dinner", "weather": "cold"}
+    assert ranker.signals(p) == {
+        "healthy": SIGNAL_WEIGHTS["food_pref"],
+        "spicy:chilli": SIGNAL_WEIGHTS["spicy_type"],
+        "health_goal:lose weight": SIGNAL_WEIGHTS["health_goal"],
+        "meal_time:dinner": SIGNAL_WEIGHTS["meal_time"],
+        "spicy": SIGNAL_WEIGHTS["weather"],
+    }
+    assert ranker.signals({"food_pref": "pizza", "weather": "mild"}) == {}
+    assert ranker.signals(None) == {}
+
+
+def test_tiebreak_is_stable_per_user():
+    a = ranker.tiebreak("alice")
+    assert np.array_equal(a, Ranker().tiebreak("alice"))
+    assert not np.array_equal(a, ranker.tiebreak("bob"))
+    assert a.min() >= 0 and a.max() < TIEBREAK_SCALE
+
+
+def test_top_k_stays_in_category():
+    top = ranker.top_k("rice", {}, [], k=3, user_id="alice")
+    assert len(top) == 3
+    assert set(top) <= set(catalog.ids("rice"))
+
+
+def test_top_k_prefers_signals():
+    # 午餐里带 rice 标签的菜加分，排在前面
+    top = ranker.top_k("meal_time:lunch", {"rice": 1.0}, [], k=2, user_id="alice")
+    assert set(top) <= set(catalog.ids("rice"))
+
+
+def test_recent_dishes_are_left_out():
+    rice = catalog.ids("rice")
+    decay = np.zeros(len(catalog), dtype=np.float32)
+    decay[rice[0]] = AVOID_THRESHOLD
+    decay[rice[1]] = AVOID_THRESHOLD / 2
+    top = ranker.top_k("rice", {}, decay, k=4, user_id="alice")
+    assert rice[0] not in top
+    assert top[-1] == rice[1]  # 吃过一点的排到最后
+    assert ranker.top_k("rice", {}, [catalog.name(i) for i in rice], k=4) == []
+
+
+def test_batch_matches_single_and_takes_generators():
+    users = ["alice", "bob", "carol"]
+    decays = [np.random.default_rng(i).random(len(catalog), dtype=np.float32) * 0.3 for i in range(3)]
+    cases = [("rice", {}), ("spicy:default", {"spicy": 0.5}), ("healthy", {"healthy": 1.0})]
+    rows = [(c, s, d, u) for c, s in cases for d, u in zip(decays, users)]
+    batch = ranker.top_k_batch((r[0] for r in rows), (r[1] for r in rows),
+                               (r[2].copy() for r in rows), (r[3] for r in rows))
+    assert batch == [ranker.top_k(c, s, d, user_id=u) for c, s, d, u in rows]
@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+import user_data
+from catalog import catalog
+from history import EVENT_DTYPE, MealHistory
+
+
+def test_migrate_json_round_trip(tmp_path):
+    src = tmp_path / "user_data.json"
+    src.write_text(json.dumps({
+        "legacy": ["Kimchi Stew", "Hot Pot", "Not On The Menu"],
+        "events": [["Tteokbokki", 1000], ["Spicy Udon", 2000]],
+    }))
+    store = user_data.SQLiteHistoryStore(str(tmp_path / "user_data.db"))
+    assert user_data.migrate_from_json(str(src), store) == 2
+
+    assert user_data.recent_names(store.get("legacy")) == ["Kimchi Stew", "Hot Pot"]
+    events = store.get("events").chronological()
+    assert [(catalog.name(int(d)), int(ts)) for d, ts in events] == [("Tteokbokki", 1000), ("Spicy Udon", 2000)]
+    # 重新打开数据库，dish code 不变
+    reopened = user_data.SQLiteHistoryStore(str(tmp_path / "user_data.db"))
+    assert reopened.get("events").to_bytes() == store.get("events").to_bytes()
+
+
+def test_json_store_add(tmp_path):
+    store = user_data.JsonHistoryStore(str(tmp_path / "user_data.json"))
+    store.add("u", "Hot Pot", ts=100)
+    store.add("u", "Not On The Menu", ts=150)
+    store.add("u", "Kimchi Stew", ts=200)
+    reopened = user_data.JsonHistoryStore(store.path)
+    assert user_data.recent_names(reopened.get("u")) == ["Hot Pot", "Kimchi Stew"]
+    assert reopened.user_ids() == ["u"]
+
+
+def test_append_bumps_version(store):
+    assert store.get_versioned("u")[1] == 0
+    history, version = store.append("u", [(1, 100), (2, 200)])
+    assert version == 1 and store.version("u") == 1
+    assert store.get("u").chronological().tolist() == history.chronological().tolist()
+
+
+def test_json_store_append(tmp_path):
+    store = user_data.JsonHistoryStore(str(tmp_path / "user_data.json"))
+    store.add("u", "Hot Pot", ts=100)
+    history, version = store.append("u", [(catalog.lookup("Kimchi Stew"), 200)])
+    assert user_data.recent_names(store.get("u")) == ["Hot Pot", "Kimchi Stew"]
+    assert version == store.version("u") != 0
+    assert isinstance(history, MealHistory)
+
+
+def test_cached_session_rereads_after_outside_write(store):
+    session = user_data.open_session("u")
+    session.add_meal("Hot Pot")
+    user_data.close_session(session)
+
+    # 另一个进程写入同一个用户
+    subprocess.run([sys.executable, "-c",
+                    "import user_data; user_data.SQLiteHistoryStore(%r).add('u', 'Kimchi Stew')" % store.path],
+                   check=True, cwd=os.path.dirname(user_data.__file__))
+
+    session = user_data.open_session("u")
+    session.add_meal("Tteokbokki")
+    user_data.close_session(session)
+    assert user_data.get_recent_meals("u") == ["Hot Pot", "Kimchi Stew", "Tteokbokki"]
+
+
+def test_decode_drops_unknown_codes(store):
+    code = int(store._code_of[3])
+    blob = np.array([(-1, 10), (code, 20), (10 ** 6, 30)], dtype=EVENT_DTYPE).tobytes()
+    assert store._decode(blob).chronological().tolist() == [(3, 20)]
@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from weather import UNKNOWN, FixtureWeatherProvider, WeatherProvider, WeatherService, classify
+
+
+class FakeProvider(WeatherProvider):
+    def __init__(self, answers=None, delay=0.0):
+        self.answers = answers or {}
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def fetch(self, location):
+        with self.lock:
+            self.calls.append(location)
+        time.sleep(self.delay)
+        answer = self.answers.get(location, "cold")
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def test_classify():
+    assert classify(None) == UNKNOWN
+    assert classify(3.0) == "cold"
+    assert classify(18.0) == "mild"
+    assert classify(30.0) == "hot"
+
+
+def test_fixture_provider(tmp_path):
+    path = tmp_path / "weather.json"
+    path.write_text(json.dumps({"Seoul": "cold", "Bangkok": 33.0, "New  York": 11.0, "Tokyo": 18.5}))
+    provider = FixtureWeatherProvider(str(path))
+    assert provider.fetch("seoul") == "cold"
+    assert provider.fetch("Bangkok") == "hot"
+    assert provider.fetch(" new york ") == "cold"
+    assert provider.fetch("Tokyo") == "mild"
+    assert provider.fetch("Atlantis") == UNKNOWN
+
+
+def test_cached_until_ttl():
+    provider = FakeProvider()
+    service = WeatherService(provider, ttl=0.2, budget=1.0)
+    assert service.lookup("Seoul") == "cold"
+    assert service.lookup(" seoul ") == "cold"
+    assert len(provider.calls) == 1
+    time.sleep(0.25)
+    assert service.lookup("Seoul") == "cold"
+    assert len(provider.calls) == 2
+
+
+def test_failures_use_shorter_ttl():
+    provider = FakeProvider({"Nowhere": RuntimeError("boom")})
+    service = WeatherService(provider, ttl=60, failure_ttl=0.1, budget=1.0)
+    assert service.lookup("Nowhere") == UNKNOWN
+    assert service.lookup("Nowhere") == UNKNOWN
+    assert len(provider.calls) == 1
+    time.sleep(0.15)
+    service.lookup("Nowhere")
+    assert len(provider.calls) == 2
+
+
+def test_concurrent_lookups_share_one_fetch():
+    provider = FakeProvider(delay=0.2)
+    service = WeatherService(provider, budget=2.0)
+    with ThreadPoolExecutor(10) as pool:
+        results = list(pool.map(service.lookup, ["Seoul"] * 10))
+    assert results == ["cold"] * 10
+    assert provider.calls == ["Seoul"]
+
+
+def test_slow_lookup_falls_back_and_fills_cache():
+    provider = FakeProvider(delay=0.2)
+    service = WeatherService(provider, budget=0.02)
+    start = time.perf_counter()
+    assert service.lookup("Seoul") == UNKNOWN
+    assert time.perf_counter() - start < 0.15
+    time.sleep(0.3)
+    assert service.lookup("Seoul") == "cold"
+    assert len(provider.calls) == 1
+
+
+def test_cache_is_bounded():
+    count = 20
+    provider = FakeProvider()
+    service = WeatherService(provider, budget=1.0, maxsize=5)
+    for i in range(count):
+        service.lookup(f"city-{i}")
+    assert len(service._cache) == 5
+    service.lookup("city-19")
+    assert len(provider.calls) == count
+    service.lookup("city-0")
+    assert len(provider.calls) == count + 1
@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import metrics
+import precompute
+import user_data
+import webhook
+
+MEALS = ["Kimchi Stew", "Tteokbokki", "Hot Pot", "Spicy Udon"]
+
+
+def payload(intent, user="alice", **params):
+    return {"session": f"projects/test/agent/sessions/{user}",
+            "queryResult": {"intent": {"displayName": intent}, "parameters": params}}
+
+
+@pytest.fixture
+def client(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(webhook, "precomputed", precompute.Precomputed(str(tmp_path / "missing.bin")))
+    return webhook.app.test_client()
+
+
+def test_concurrent_writes_for_one_user(client, store):
+    def send(i):
+        resp = client.post("/webhook", json=payload("record.recent.meal", recent_meal=MEALS[i % len(MEALS)]))
+        assert resp.status_code == 200
+
+    with ThreadPoolExecutor(16) as pool:
+        list(pool.map(send, range(40)))
+    assert len(store.get("alice")) == 40
+    assert store.version("alice") == 40
+
+
+def test_recommendation_is_recorded(client, store):
+    resp = client.post("/webhook", json=payload("healthy.preference"))
+    assert "You might enjoy" in resp.get_json()["fulfillmentText"]
+    assert len(store.get("alice")) == 1
+
+
+def test_failed_write_is_an_error(client, store, monkeypatch):
+    def fail(user_id, events):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(store, "append", fail)
+    errors = metrics.requests_total.value("record.recent.meal", "error")
+    resp = client.post("/webhook", json=payload("record.recent.meal", recent_meal="Hot Pot"))
+    assert resp.status_code == 500
+    assert metrics.requests_total.value("record.recent.meal", "error") == errors + 1
+
+
+@pytest.mark.parametrize("body", ["null", "{not json"])
+def test_bad_body_is_counted(client, body):
+    errors = metrics.requests_total.value("none", "error")
+    resp = client.post("/webhook", data=body, content_type="application/json")
+    assert resp.status_code >= 400
+    assert metrics.requests_total.value("none", "error") == errors + 1
+
+
+def test_unknown_intents_share_one_label(client):
+    ok = metrics.requests_total.value("unknown", "ok")
+    for i in range(5):
+        client.post("/webhook", json=payload(f"garbage-{i}"))
+    assert metrics.requests_total.value("unknown", "ok") == ok + 5
+    assert "garbage" not in metrics.render()
+
+
+def test_failed_read_keeps_intent(client, store, monkeypatch):
+    def fail(user_id):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(store, "get_versioned", fail)
+    errors = metrics.requests_total.value("healthy.preference", "error")
+    resp = client.post("/webhook", json=payload("healthy.preference", user="nobody"))
+    assert resp.status_code == 500
+    assert metrics.requests_total.value("healthy.preference", "error") == errors + 1
+
+
+def test_picture_conditional_and_range(client):
+    filename = webhook.images.filename("Kimchi Stew")
+    resp = client.get(f"/picture/{filename}")
+    assert resp.status_code == 200
+    etag, body = resp.headers["ETag"], resp.data
+
+    resp = client.get(f"/picture/{filename}", headers={"If-None-Match": etag})
+    assert resp.status_code == 304 and resp.data == b""
+
+    resp = client.get(f"/picture/{filename}", headers={"Range": "bytes=0-99"})
+    assert resp.status_code == 206
+    assert resp.data == body[:100]
+    assert resp.headers["Content-Range"] == f"bytes 0-99/{len(body)}"
+
+
+def test_unknown_picture(client):
+    assert client.get("/picture/nope.jpg").status_code == 404
+
+
+def test_meal_not_on_menu_is_not_claimed(client, store):
+    resp = client.post("/webhook", json=payload("record.recent.meal", recent_meal="Pizza"))
+    assert "isn’t on my menu" in resp.get_json()["fulfillmentText"]
+    assert len(store.get("alice")) == 0
+
+    resp = client.post("/webhook", json=payload("record.recent.meal", recent_meal="Hot Pot"))
+    assert "I’ve noted that you had Hot Pot" in resp.get_json()["fulfillmentText"]
+    assert user_data.get_recent_meals("alice") == ["Hot Pot"]
+
+
+@pytest.mark.parametrize("food_pref", ["health_goal", "meal_time", "spicy:chilli"])
+def test_internal_categories_are_not_preferences(client, food_pref):
+    resp = client.post("/webhook", json=payload("choose.delivery", delivery_option="delivery",
+                                                 food_preference=food_pref))
+    assert "Here are some tasty picks" in resp.get_json()["fulfillmentText"]
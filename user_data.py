@@ -1,27 +1,445 @@
 # user_data.py
 import os
 import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能单进程使用 JSON 存储
+    fcntl = None
+
+import numpy as np
+
+import metrics
+from catalog import catalog
+from history import EVENT_DTYPE, MealHistory
 
 USER_DATA_FILE = "user_data.json"
+USER_DB_FILE = os.environ.get("USER_DB_FILE", "user_data.db")
+MAX_RECENT_MEALS = 5
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", 1024))
+SESSION_TTL = float(os.environ.get("SESSION_TTL", 300))
+# 旧数据只有菜名没有时间，按每隔一小时吃一次来换算
+LEGACY_MEAL_SPACING = 3600
+
+
+def history_from_names(names, now=None):
+    """Convert a legacy list of dish names (oldest first) into a MealHistory."""
+    now = int(time.time() if now is None else now)
+    ids = [dish_id for dish_id in map(catalog.lookup, names) if dish_id is not None]
+    return MealHistory.from_events((dish_id, now - (len(ids) - 1 - i) * LEGACY_MEAL_SPACING)
+                                   for i, dish_id in enumerate(ids))
+
+
+def recent_names(history, limit=MAX_RECENT_MEALS):
+    return [catalog.name(dish_id) for dish_id in history.recent_ids(limit)]
+
+
+class JsonHistoryStore:
+    """Legacy backend: the whole history lives in one JSON file.
+
+    Every write rewrites the file, so this is only kept for small local
+    setups and as the source format for `migrate_from_json`. Users map to
+    a list of [dish name, timestamp] events; plain dish-name lists from
+    older files are still read.
+
+    Writes go to a temp file that replaces the original atomically, and
+    read-modify-write holds an exclusive `flock` on `<path>.lock`, so
+    several worker processes can share the file. Without `fcntl`
+    (Windows) only a thread lock is taken, so use a single process there.
+    """
+
+    def __init__(self, path=USER_DATA_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load_all(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                return json.load(f)
+        return {}
+
+    def _save_all(self, data):
+        # 先写临时文件再原子替换，别的进程不会读到写了一半的文件
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _decode(events):
+        if events and all(isinstance(event, str) for event in events):
+            return history_from_names(events)
+        return MealHistory.from_events((dish_id, ts) for dish_id, ts in
+                                       ((catalog.lookup(name), ts) for name, ts in events)
+                                       if dish_id is not None)
+
+    @staticmethod
+    def _encode(history):
+        return [[catalog.name(int(e["dish"])), int(e["ts"])] for e in history.chronological()]
+
+    def version(self, user_id):
+        # 整个文件一个版本号：任何写入都会让所有缓存失效
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def get_versioned(self, user_id):
+        version = self.version(user_id)
+        return self.get(user_id), version
+
+    def get(self, user_id):
+        return self._decode(self.load_all().get(user_id, []))
+
+    def put(self, user_id, history):
+        with self._locked():
+            data = self.load_all()
+            data[user_id] = self._encode(history)
+            self._save_all(data)
+
+    def append(self, user_id, events):
+        """Add (dish_id, ts) events to the stored history; returns (history, version)."""
+        with self._locked():
+            data = self.load_all()
+            history = self._decode(data.get(user_id, []))
+            for dish_id, ts in events:
+                history.add(dish_id, ts)
+            data[user_id] = self._encode(history)
+            self._save_all(data)
+            return history, self.version(user_id)
+
+    def add(self, user_id, meal, ts=None):
+        dish_id = catalog.lookup(meal)
+        if dish_id is not None:
+            self.append(user_id, [(dish_id, ts)])
+
+    def user_ids(self):
+        return list(self.load_all().keys())
+
+    def items(self):
+        for user_id, events in self.load_all().items():
+            yield user_id, self._decode(events)
+
+
+class SQLiteHistoryStore:
+    """Per-user keyed history in SQLite (WAL mode).
+
+    Each user is one row holding their ring buffer as a BLOB of
+    (dish code, timestamp) pairs and a version that every write bumps.
+    Dish codes come from the `dishes` table and never change, so reordering
+    the catalog doesn't scramble stored history. Reads and writes touch a single row, and read-modify-write
+    runs inside `BEGIN IMMEDIATE` so concurrent gunicorn workers don't
+    lose updates.
+    """
+
+    def __init__(self, path=USER_DB_FILE, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._codes_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS dishes (code INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)")
+        # 启动时给所有菜分配好 code（自动提交），用户事务里不再插 dishes，回滚也不会让 code 失效
+        conn.executemany("INSERT OR IGNORE INTO dishes (name) VALUES (?)",
+                         [(dish.name,) for dish in catalog.dishes])
+        self._load_codes()
+        conn.execute("CREATE TABLE IF NOT EXISTS meal_history ("
+                     "user_id TEXT PRIMARY KEY, events BLOB NOT NULL, version INTEGER NOT NULL DEFAULT 0)")
+
+    def _conn(self):
+        # sqlite3 连接不能跨线程共享，每个线程一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _rollback(self, conn):
+        conn.execute("ROLLBACK")
+
+    def _load_codes(self):
+        # 先建好新数组再整体替换，别的线程永远看不到半成品
+        rows = self._conn().execute("SELECT code, name FROM dishes").fetchall()
+        code_of = np.full(len(catalog), -1, dtype=np.int64)  # dish id -> code
+        id_of = np.full(max((code for code, _ in rows), default=-1) + 1, -1, dtype=np.int32)  # code -> dish id
+        for code, name in rows:
+            dish_id = catalog.lookup(name)
+            if dish_id is not None:
+                id_of[code] = dish_id
+                code_of[dish_id] = code
+        with self._codes_lock:
+            self._code_of, self._id_of = code_of, id_of
+
+    def _encode(self, history):
+        events = history.chronological().copy()
+        codes = self._code_of[events["dish"]]
+        if (codes < 0).any():
+            raise ValueError(f"dishes without a code in {self.path}: {sorted(set(events['dish'][codes < 0]))}")
+        events["dish"] = codes
+        return events.tobytes()
+
+    def _decode(self, blob):
+        events = np.frombuffer(blob, dtype=EVENT_DTYPE).copy()
+        codes = events["dish"]
+        if len(codes) and codes.max() >= len(self._id_of):
+            self._load_codes()  # 别的进程（新版菜单）加了菜
+        id_of = self._id_of
+        ids = np.full(len(codes), -1, dtype=np.int32)
+        known = (codes >= 0) & (codes < len(id_of))
+        ids[known] = id_of[codes[known]]
+        events["dish"] = ids
+        return MealHistory.from_bytes(events[ids >= 0].tobytes())  # 已下架的菜丢掉
+
+    UPSERT = ("INSERT INTO meal_history (user_id, events, version) VALUES (?, ?, 1) "
+              "ON CONFLICT(user_id) DO UPDATE SET events = excluded.events, version = meal_history.version + 1")
+
+    def version(self, user_id):
+        row = self._conn().execute(
+            "SELECT version FROM meal_history WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_versioned(self, user_id):
+        row = self._conn().execute(
+            "SELECT events, version FROM meal_history WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return (self._decode(row[0]), row[1]) if row else (MealHistory(), 0)
+
+    def get(self, user_id):
+        return self.get_versioned(user_id)[0]
+
+    def put(self, user_id, history):
+        self._conn().execute(self.UPSERT, (user_id, self._encode(history)))
+
+    def append(self, user_id, events):
+        """Add (dish_id, ts) events to the stored history; returns (history, version).
 
-def load_user_data():
-    if os.path.exists(USER_DATA_FILE):
-        with open(USER_DATA_FILE, "r") as f:
-            return json.load(f)
-    return {}
+        The row is re-read inside the write transaction, so events from
+        other requests or processes are never overwritten.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            history, version = self.get_versioned(user_id)
+            for dish_id, ts in events:
+                history.add(dish_id, ts)
+            self.put(user_id, history)
+            conn.execute("COMMIT")
+        except Exception:
+            self._rollback(conn)
+            raise
+        return history, version + 1
+
+    def add(self, user_id, meal, ts=None):
+        dish_id = catalog.lookup(meal)
+        if dish_id is not None:
+            self.append(user_id, [(dish_id, ts)])
+
+    def put_many(self, items):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(self.UPSERT, [(user_id, self._encode(history)) for user_id, history in items])
+            conn.execute("COMMIT")
+        except Exception:
+            self._rollback(conn)
+            raise
+
+    def user_ids(self):
+        return [row[0] for row in self._conn().execute("SELECT user_id FROM meal_history")]
+
+    def items(self):
+        for user_id, events in self._conn().execute("SELECT user_id, events FROM meal_history"):
+            yield user_id, self._decode(events)
+
+
+BACKENDS = {
+    "json": JsonHistoryStore,
+    "sqlite": SQLiteHistoryStore,
+}
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = BACKENDS[os.environ.get("USER_STORE", "sqlite")]()
+    return _store
+
+
+def set_store(store):
+    global _store
+    _store = store
+    session_cache.clear()
+
+
+def migrate_from_json(json_path=USER_DATA_FILE, store=None):
+    """Copy every user from a legacy `user_data.json` into `store`."""
+    store = store or get_store()
+    items = list(JsonHistoryStore(json_path).items())
+    if hasattr(store, "put_many"):
+        store.put_many(items)
+    else:
+        for user_id, history in items:
+            store.put(user_id, history)
+    return len(items)
+
+
+class UserSession:
+    """One user's history for the duration of a webhook request.
+
+    Loaded once and read in memory. Meals added during the request are
+    kept in `pending` and `flush()` appends just those to the store in one
+    transaction, so concurrent requests for the same user don't overwrite
+    each other.
+    """
+
+    def __init__(self, user_id, history, version=0):
+        self.user_id = user_id
+        self.history = history
+        self.version = version
+        self.pending = []
+        self._lock = threading.Lock()
+
+    @property
+    def dirty(self):
+        return bool(self.pending)
+
+    def decay_vector(self, now=None):
+        with self._lock:
+            return self.history.decay_vector(len(catalog), now)
+
+    def add_meal(self, meal, ts=None):
+        """Record a meal; returns False if it isn't in the catalog (not recorded)."""
+        dish_id = catalog.lookup(meal)
+        if dish_id is None:
+            return False
+        ts = int(time.time() if ts is None else ts)
+        with self._lock:
+            self.history.add(dish_id, ts)
+            self.pending.append((dish_id, ts))
+        return True
+
+    def flush(self, store=None):
+        with self._lock:
+            if not self.pending:
+                return
+            start = time.perf_counter()
+            self.history, self.version = (store or get_store()).append(self.user_id, self.pending)
+            metrics.user_store_seconds.observe(time.perf_counter() - start, "write")
+            self.pending = []
+
+
+class SessionCache:
+    """Bounded LRU of recently used histories with TTL expiry.
+
+    Entries are (version, history bytes) snapshots, not live sessions;
+    every request gets its own UserSession built from the snapshot.
+    """
+
+    def __init__(self, maxsize=SESSION_CACHE_SIZE, ttl=SESSION_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None:
+                return None
+            expires, version, data = item
+            if expires < time.monotonic():
+                del self._items[user_id]
+                return None
+            self._items.move_to_end(user_id)
+            return version, data
+
+    def put(self, user_id, version, history):
+        with self._lock:
+            self._items[user_id] = (time.monotonic() + self.ttl, version, history.to_bytes())
+            self._items.move_to_end(user_id)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, user_id):
+        with self._lock:
+            self._items.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+session_cache = SessionCache()
+
+
+def open_session(user_id):
+    store = get_store()
+    cached = session_cache.get(user_id)
+    if cached is not None:
+        version, data = cached
+        start = time.perf_counter()
+        current = store.version(user_id)
+        metrics.user_store_seconds.observe(time.perf_counter() - start, "version")
+        # 版本号对得上才用缓存，别的进程写过就重新读
+        if current == version:
+            metrics.session_cache_total.inc("hit")
+            return UserSession(user_id, MealHistory.from_bytes(data), version)
+        metrics.session_cache_total.inc("stale")
+    else:
+        metrics.session_cache_total.inc("miss")
+    start = time.perf_counter()
+    history, version = store.get_versioned(user_id)
+    metrics.user_store_seconds.observe(time.perf_counter() - start, "read")
+    return UserSession(user_id, history, version)
+
+
+def close_session(session):
+    try:
+        session.flush()
+    except Exception:
+        session_cache.pop(session.user_id)
+        raise
+    session_cache.put(session.user_id, session.version, session.history)
 
-def save_user_data(data):
-    with open(USER_DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
 
 def get_recent_meals(user_id):
-    data = load_user_data()
-    return data.get(user_id, [])
+    return recent_names(get_store().get(user_id))
+
 
 def add_recent_meal(user_id, meal):
-    data = load_user_data()
-    meals = data.get(user_id, [])
-    if meal not in meals:
-        meals.append(meal)
-    data[user_id] = meals[-5:]  # 只保留最近5个
-    save_user_data(data)
+    get_store().add(user_id, meal)
+    session_cache.pop(user_id)
+
+
+if __name__ == "__main__":
+    # python user_data.py [user_data.json] — 一次性迁移到 SQLite
+    import sys
+
+    src = sys.argv[1] if len(sys.argv) > 1 else USER_DATA_FILE
+    count = migrate_from_json(src, SQLiteHistoryStore())
+    print(f"Migrated {count} users from {src} to {USER_DB_FILE}")
@@ -0,0 +1,156 @@
+# weather.py
+"""Weather lookup by location for weather-aware recommendations.
+
+Providers turn a location into "cold", "hot", "mild" or "unknown".
+`WeatherService` puts a per-location TTL cache in front of a provider,
+merges concurrent lookups for the same location into one fetch, and
+returns "unknown" if the answer doesn't arrive within the latency budget
+(the fetch keeps running and fills the cache for the next turn).
+"""
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+WEATHER_PROVIDER = os.environ.get("WEATHER_PROVIDER", "fixture")
+WEATHER_FIXTURE = os.environ.get("WEATHER_FIXTURE", os.path.join(BASE_DIR, "weather_fixtures.json"))
+WEATHER_TTL = float(os.environ.get("WEATHER_TTL", 900))
+WEATHER_FAILURE_TTL = float(os.environ.get("WEATHER_FAILURE_TTL", 60))
+WEATHER_BUDGET = float(os.environ.get("WEATHER_BUDGET", 0.15))
+WEATHER_CACHE_SIZE = int(os.environ.get("WEATHER_CACHE_SIZE", 1024))
+COLD_BELOW = 12.0
+HOT_ABOVE = 26.0
+UNKNOWN = "unknown"
+
+
+def classify(temperature):
+    if temperature is None:
+        return UNKNOWN
+    if temperature <= COLD_BELOW:
+        return "cold"
+    if temperature >= HOT_ABOVE:
+        return "hot"
+    return "mild"
+
+
+def normalize_location(location):
+    return " ".join(location.lower().split())
+
+
+class WeatherProvider:
+    def fetch(self, location):
+        """Return "cold", "hot", "mild" or "unknown" for `location`."""
+        raise NotImplementedError
+
+
+class FixtureWeatherProvider(WeatherProvider):
+    """Reads weather from a JSON file: {"seoul": "cold", "bangkok": 33.5, ...}.
+
+    Values are either a weather type or a temperature in °C.
+    """
+
+    def __init__(self, path=WEATHER_FIXTURE):
+        self.data = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.data = {normalize_location(k): v for k, v in json.load(f).items()}
+
+    def fetch(self, location):
+        value = self.data.get(normalize_location(location))
+        if isinstance(value, (int, float)):
+            return classify(value)
+        return value or UNKNOWN
+
+
+class OpenMeteoProvider(WeatherProvider):
+    """Current temperature from the free Open-Meteo API (no key needed)."""
+
+    GEOCODE_URL = "https://geocoding-api.open-meteo.com/v1/search"
+    FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+    def __init__(self, timeout=2.0):
+        self.timeout = timeout
+
+    def _get(self, url, params):
+        with urllib.request.urlopen(f"{url}?{urllib.parse.urlencode(params)}", timeout=self.timeout) as resp:
+            return json.load(resp)
+
+    def fetch(self, location):
+        places = self._get(self.GEOCODE_URL, {"name": location, "count": 1}).get("results") or []
+        if not places:
+            return UNKNOWN
+        forecast = self._get(self.FORECAST_URL, {
+            "latitude": places[0]["latitude"],
+            "longitude": places[0]["longitude"],
+            "current": "temperature_2m",
+        })
+        return classify(forecast.get("current", {}).get("temperature_2m"))
+
+
+PROVIDERS = {
+    "fixture": FixtureWeatherProvider,
+    "open-meteo": OpenMeteoProvider,
+}
+
+
+class WeatherService:
+    def __init__(self, provider, ttl=WEATHER_TTL, failure_ttl=WEATHER_FAILURE_TTL,
+                 budget=WEATHER_BUDGET, max_workers=4, maxsize=WEATHER_CACHE_SIZE):
+        self.provider = provider
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.budget = budget
+        self.maxsize = maxsize
+        self._cache = OrderedDict()  # location -> (expires, weather)，按最近使用排序
+        self._inflight = {}  # location -> Future
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="weather")
+
+    def _fetch(self, key, location):
+        try:
+            weather = self.provider.fetch(location)
+        except Exception:
+            weather = UNKNOWN
+        ttl = self.failure_ttl if weather == UNKNOWN else self.ttl
+        with self._lock:
+            self._cache[key] = (time.monotonic() + ttl, weather)
+            self._cache.move_to_end(key)
+            # 地点是用户输入的，缓存要有上限
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+            self._inflight.pop(key, None)
+        return weather
+
+    def lookup(self, location, budget=None):
+        if not location:
+            return UNKNOWN
+        key = normalize_location(location)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                if cached[0] > time.monotonic():
+                    self._cache.move_to_end(key)
+                    metrics.weather_lookup_total.inc("hit")
+                    return cached[1]
+                del self._cache[key]
+            # 同一地点同时只发一个请求，其余请求等同一个结果
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = self._pool.submit(self._fetch, key, location)
+        try:
+            weather = future.result(timeout=self.budget if budget is None else budget)
+        except Exception:
+            metrics.weather_lookup_total.inc("timeout")
+            return UNKNOWN
+        metrics.weather_lookup_total.inc("miss")
+        return weather
+
+
+weather_service = WeatherService(PROVIDERS[WEATHER_PROVIDER]())
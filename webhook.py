@@ -1,224 +1,245 @@
-from flask import Flask, request, jsonify
-from flask import send_from_directory
-
-from user_data import get_recent_meals, add_recent_meal
+from flask import Flask, request, jsonify, Response
+from flask import g, abort
+
+import logging
+import time
+
+import numpy as np
+
+import metrics
+from catalog import catalog
+from history import AVOID_THRESHOLD
+from images import ImageStore
+from precompute import precomputed
+from logger import get_logger, log_event, elapsed_ms
+from ranking import ranker
+from user_data import open_session, close_session
+from weather import weather_service
 import os
-import json
 
 app = Flask(__name__)
-
-USER_DATA_FILE = "user_data.json"
+log = get_logger("webhook")
+images = ImageStore(catalog)
 
 @app.route('/picture/<filename>')
 def serve_picture(filename):
-    return send_from_directory('/Users/qintongtong/Documents/FoodRecommenderBot/picture', filename)
-
-# 用户数据处理函数
-def load_user_data():
-    if os.path.exists(USER_DATA_FILE):
-        with open(USER_DATA_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_user_data(data):
-    with open(USER_DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-def get_recent_meals(user_id):
-    data = load_user_data()
-    return data.get(user_id, [])
-
-def add_recent_meal(user_id, meal):
-    data = load_user_data()
-    meals = data.get(user_id, [])
-    if meal not in meals:
-        meals.append(meal)
-    data[user_id] = meals[-5:]  # 只保留最近5个
-    save_user_data(data)
-
-# 食物推荐数据库
-food_recommendations = {
-    "spicy": {
-        "default": ["Kimchi Stew", "Tteokbokki", "Spicy Fried Chicken"],
-        "chilli": ["Chilli Ramen", "Chilli Chicken Bowl"],
-        "hot": ["Hot Pot", "Spicy Udon"]
-    },
-    "cold": ["Cold Noodles", "Chilled Tofu", "Fresh Salad"],
-    "healthy": ["Grilled Salmon", "Quinoa Salad", "Steamed Vegetables", "Tofu Bowl"],
-    "rice": ["Bibimbap", "Fried Rice", "Omurice", "Curry Rice"],
-    "pasta": ["Spaghetti Bolognese", "Carbonara", "Cream Pasta", "Pesto Pasta"],
-    "fastfood": ["Cheeseburger", "Fried Chicken", "French Fries", "Hot Dog"],
-    "default": ["Ramen", "Sandwich", "Dumplings", "Donburi"],
-    "health_goal": {
-        "lose weight": ["Quinoa Salad", "Steamed Vegetables", "Tofu Bowl"],
-        "gain muscle": ["Grilled Chicken", "Beef Bowl", "Protein Pasta"],
-        "stay healthy": ["Grilled Salmon", "Avocado Salad", "Vegetable Soup"]
-    },
-    "meal_time": {
-        "breakfast": ["Toast", "Omelette", "Yogurt Bowl", "Egg Sandwich", "Porridge", "Avocado Toast"],
-        "lunch": ["Bibimbap", "Curry Rice", "Chicken Salad", "Ramen"],
-        "dinner": ["Salmon Bowl", "Udon", "Grilled Vegetables", "Spaghetti", "Grilled Fish"]
-    }
-}
-
-# 推荐回复生成（避开最近食物）
-def build_response(recommendations, context="", user_id="default"):
-    recent = get_recent_meals(user_id)
-    filtered = [food for food in recommendations if food not in recent]
+    asset, data = images.get(filename)
+    if asset is None:
+        abort(404)
+    resp = Response(data, mimetype=asset.mimetype)
+    resp.set_etag(asset.etag)
+    if asset.immutable:
+        resp.cache_control.public = True
+        resp.cache_control.max_age = 31536000
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.public = True
+        resp.cache_control.max_age = 3600
+    # 处理 If-None-Match / Range，返回 304 或 206
+    return resp.make_conditional(request, accept_ranges=True, complete_length=len(data))
+
+# 推荐回复生成（综合打分，避开最近常吃的）
+def build_response(category, context="", user=None, params=None):
+    user = user or g.user
+    params = params if params is not None else g.get("params")
+    decay = user.decay_vector()
+    signals = ranker.signals(params)
+    # 先查离线预计算结果，没有或过期再现算
+    top = precomputed.lookup(user.user_id, user.history, category, signals)
+    if top is None:
+        top = ranker.top_k(category, signals, decay, k=3, user_id=user.user_id)
+    filtered = [i for i in top if decay[i] < AVOID_THRESHOLD]
 
     if not filtered:
-        first = recommendations[0]
-        img_url = f"https://food-recommender-bot.onrender.com/picture/{first.lower().replace(' ', '_')}.jpg"
+        ids = catalog.ids(category)
+        first = catalog.name(ids[int(np.argmin(decay[list(ids)]))])  # 衰减分数最低的那个
+        img_url = images.url(first)
         return f"{context} But you’ve tried them all recently 😅. How about trying them again? {first}\n[Image]({img_url})"
-    
-    first = filtered[0]
-    add_recent_meal(user_id, first)
-    img_url = f"https://food-recommender-bot.onrender.com/picture/{first.lower().replace(' ', '_')}.jpg"
-    
+
+    first = catalog.name(filtered[0])
+    user.add_meal(first)
+    img_url = images.url(first)
+
     phrase = f"{context} You might enjoy {first}\n[Image]({img_url})"
     if len(filtered) > 1:
-        phrase += f", or maybe {', '.join(filtered[1:3])}."
+        phrase += f", or maybe {', '.join(catalog.name(i) for i in filtered[1:3])}."
     return phrase
 
+# Dialogflow 没给 weather_type 时按地点查天气
+def resolve_weather(p):
+    if not p["weather"] and p["location"]:
+        weather = weather_service.lookup(p["location"])
+        if weather != "unknown":
+            p["weather"] = weather
+    return p["weather"]
+
+# intent 名 -> 处理函数，启动时注册一次
+INTENT_HANDLERS = {}
+
+def intent_handler(*names):
+    def register(func):
+        for name in names:
+            INTENT_HANDLERS[name] = func
+        return func
+    return register
+
+@intent_handler("start.recommendation")
+def handle_start(p, user):
+    return "Do you have any food preferences? For example: spicy, healthy, rice, pasta, or no preference."
+
+@intent_handler("spicy.preference")
+def handle_spicy(p, user):
+    spicy_type = p["spicy_type"]
+    if spicy_type and f"spicy:{spicy_type}" in catalog:
+        return build_response(f"spicy:{spicy_type}", f"Spicy ({spicy_type}) suggestion 🌶️", user)
+    return build_response("spicy:default", "Here’s a spicy suggestion 🌶️", user)
+
+@intent_handler("healthy.preference")
+def handle_healthy(p, user):
+    return build_response("healthy", "Healthy and delicious 🥗", user)
+
+@intent_handler("no.preference")
+def handle_no_preference(p, user):
+    if not p["food_pref"]:
+        return "Do you have any food preferences? For example: spicy, healthy, rice, pasta, or fast food."
+    weather = resolve_weather(p)
+    if not weather:
+        return "What's the weather like? Cold or hot?"
+    if weather == "cold":
+        return build_response("spicy:default", "Cold day? Try these hot dishes 🔥", user)
+    if weather == "hot":
+        return build_response("cold", "Hot weather? Try something refreshing ❄️", user)
+    return build_response("default", "Here are some ideas:", user)
+
+@intent_handler("cold.preference")
+def handle_cold(p, user):
+    return build_response("spicy:default", "It’s cold today ❄️. Try these hot dishes 🔥", user)
+
+@intent_handler("rice.preference", "pasta.preference", "fastfood.preference")
+def handle_category(p, user):
+    key = p["intent"].split(".")[0]  # rice / pasta / fastfood
+    return build_response(key, f"Suggestions for {key} 🍽️", user)
+
+@intent_handler("choose.delivery", "choosen.dinein", "followup.delivery.option")
+def handle_delivery(p, user):
+    food_pref = p["food_pref"]
+    if p["delivery"] == "delivery":
+        if food_pref in catalog.preferences:
+            return build_response(food_pref, f"You chose delivery 🚚. Here are some {food_pref} options:", user)
+        return build_response("default", "You chose delivery 🚚. Here are some tasty picks:", user)
+    if p["delivery"] == "dine in":
+        if food_pref in catalog.preferences:
+            return build_response(food_pref, f"You prefer dining in 🍽️. Try these {food_pref} dishes:", user)
+        return build_response("default", "Dining in sounds good 🍽️. Try these dishes:", user)
+    return "Do you prefer delivery or eating in?"
+
+@intent_handler("health.goal.recommendation")
+def handle_health_goal(p, user):
+    health_goal = p["health_goal"]
+    if f"health_goal:{health_goal}" in catalog:
+        return build_response(f"health_goal:{health_goal}", f"Suggestions to help you {health_goal} 💪:", user)
+    return "Could you tell me your health goal again? For example, say 'lose weight' or 'gain muscle'."
+
+@intent_handler("meal.time.recommendation")
+def handle_meal_time(p, user):
+    meal_time = p["meal_time"]
+    if f"meal_time:{meal_time}" in catalog:
+        return build_response(f"meal_time:{meal_time}", f"{meal_time.capitalize()} options ☀️:", user)
+    return "Is it breakfast, lunch, or dinner time?"
+
+@intent_handler("personalized.recommendation")
+def handle_personalized(p, user):
+    food_pref = p["food_pref"]
+    weather = resolve_weather(p)
+    if food_pref in catalog.preferences:
+        return build_response(food_pref, f"Tailored pick for {food_pref}:", user)
+    if weather == "cold":
+        return build_response("spicy:default", "Cold day special 🔥", user)
+    if weather == "hot":
+        return build_response("cold", "Cool choices for hot weather ❄️", user)
+    return build_response("default", "How about these:", user)
+
+@intent_handler("record.recent.meal")
+def handle_record_meal(p, user):
+    if p["recent_meal"] and g.get("meal_recorded"):
+        return f"Thanks! I’ve noted that you had {p['recent_meal']}. I’ll avoid recommending it again."
+    if p["recent_meal"]:
+        return f"Thanks! {p['recent_meal']} isn’t on my menu, so I can’t keep track of it."
+    return "Got it! Could you repeat the food you just had?"
+
+def handle_unknown(p, user):
+    return "Sorry, I didn’t understand. Can you try again?"
+
+def get_param(parameters, name):
+    # Dialogflow 有时把参数传成列表，只取第一个
+    value = parameters.get(name, "")
+    if isinstance(value, list):
+        value = value[0] if value else ""
+    if isinstance(value, dict):  # @sys.location 是一个对象
+        value = value.get("city") or value.get("admin-area") or value.get("country") or ""
+    return str(value).strip()
+
+def parse_parameters(intent, parameters, user_id=""):
+    return {
+        "intent": intent,
+        "user_id": user_id,
+        "food_pref": get_param(parameters, "food_preference").lower(),
+        "weather": get_param(parameters, "weather_type").lower(),
+        "delivery": get_param(parameters, "delivery_option").lower(),
+        "spicy_type": get_param(parameters, "spicy_type").lower(),
+        "recent_meal": get_param(parameters, "recent_meal"),
+        "health_goal": get_param(parameters, "health_goal").lower(),
+        "meal_time": get_param(parameters, "meal_time").lower(),
+        "location": get_param(parameters, "geo-city") or get_param(parameters, "location"),
+    }
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+    if request.endpoint == "webhook":
+        # 先放一个空的，请求体解析失败（400/500）也能被统计到 intent="none"
+        g.params = parse_parameters("", {})
+
+@app.after_request
+def record_status(resp):
+    g.status = "error" if resp.status_code >= 400 else "ok"
+    return resp
+
+@app.teardown_request
+def record_request(exc=None):
+    params = g.get("params")
+    if params is not None:
+        # intent 名来自请求体，不认识的统一记成 "unknown"，免得指标/日志标签无限增长
+        intent = params["intent"] if params["intent"] in INTENT_HANDLERS else ("unknown" if params["intent"] else "none")
+        status = "error" if exc is not None else g.get("status", "error")
+        metrics.requests_total.inc(intent, status)
+        metrics.request_seconds.observe(time.perf_counter() - g.start, intent)
+        log_event(log, "webhook", level=logging.ERROR if status == "error" else logging.INFO, exc=exc,
+                  intent=intent, user=params["user_id"], status=status, ms=elapsed_ms(g.start),
+                  params={k: v for k, v in params.items() if v and k not in ("intent", "user_id")})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/webhook", methods=["POST"])
 def webhook():
     req = request.get_json()
-    print("Webhook hit!")
-    print("Request JSON:", req)
 
     intent = req.get("queryResult", {}).get("intent", {}).get("displayName", "")
     parameters = req.get("queryResult", {}).get("parameters", {})
     session = req.get("session", "unknown_session")
     user_id = session.split("/")[-1]  # 用 session id 作为用户唯一标识
+    p = g.params = parse_parameters(intent, parameters, user_id)
+    user = g.user = open_session(user_id)  # 本次请求只读一次，回复前统一写回
 
-    # 参数获取
-    food_pref = parameters.get("food_preference", "").lower()
-    weather = parameters.get("weather_type", "").lower()
-    delivery = parameters.get("delivery_option", "").lower()
-    spicy_type = parameters.get("spicy_type", "").lower()
-    recent_meal = parameters.get("recent_meal", "").strip()
-    health_goal = parameters.get("health_goal", "").lower()
-    meal_time = parameters.get("meal_time", "").lower()
-  
     # 记录最近吃过的
-    if recent_meal:
-        add_recent_meal(user_id, recent_meal)
-    
-    response_text = ""
-    
-    if intent == "start.recommendation":
-        response_text = "Do you have any food preferences? For example: spicy, healthy, rice, pasta, or no preference."
-
-    elif intent == "spicy.preference":
-        if spicy_type and spicy_type in food_recommendations["spicy"]:
-            response_text = build_response(
-                food_recommendations["spicy"][spicy_type],
-                f"Spicy ({spicy_type}) suggestion 🌶️",
-                user_id
-            )
-        else:
-            response_text = build_response(
-                food_recommendations["spicy"]["default"],
-                "Here’s a spicy suggestion 🌶️",
-                user_id
-            )
-
-    elif intent == "healthy.preference":
-        response_text = build_response(food_recommendations["healthy"], "Healthy and delicious 🥗")
-
-    elif intent == "no.preference":
-        if not food_pref:
-            response_text = "Do you have any food preferences? For example: spicy, healthy, rice, pasta, or fast food."
-        elif not weather:
-            response_text = "What's the weather like? Cold or hot?"
-        else:
-            if weather == "cold":
-                response_text = build_response(food_recommendations["spicy"]["default"], "Cold day? Try these hot dishes 🔥")
-            elif weather == "hot":
-                response_text = build_response(food_recommendations["cold"], "Hot weather? Try something refreshing ❄️")
-            else:
-                response_text = build_response(food_recommendations["default"], "Here are some ideas:")
-    
-    elif intent == "cold.preference":
-        response_text = build_response(
-            food_recommendations["spicy"]["default"],
-            "It’s cold today ❄️. Try these hot dishes 🔥",
-            user_id
-        )
-        
-    elif intent in ["rice.preference", "pasta.preference", "fastfood.preference"]:
-        key = intent.split(".")[0]  # rice / pasta / fastfood
-        if key in food_recommendations:
-            response_text = build_response(food_recommendations[key], f"Suggestions for {key} 🍽️")
-
-    elif intent in ["choose.delivery", "choosen.dinein", "followup.delivery.option"]:
-        delivery = parameters.get("delivery_option", "").lower()
-        recent = get_recent_meals(user_id)
-
-        if delivery == "delivery":
-            if food_pref in food_recommendations:
-                choices = [m for m in food_recommendations[food_pref] if m not in recent]
-                response_text = build_response(choices, f"You chose delivery 🚚. Here are some {food_pref} options:")
-            else:
-                response_text = build_response(food_recommendations["default"], "You chose delivery 🚚. Here are some tasty picks:")
-    
-        elif delivery == "dine in":
-            if food_pref in food_recommendations:
-                choices = [m for m in food_recommendations[food_pref] if m not in recent]
-                response_text = build_response(choices, f"You prefer dining in 🍽️. Try these {food_pref} dishes:")
-            else:
-                response_text = build_response(food_recommendations["default"], "Dining in sounds good 🍽️. Try these dishes:")
-    
-        else:
-            response_text = "Do you prefer delivery or eating in?"
-
-    elif intent == "health.goal.recommendation":
-        health_goal_list = req['queryResult']['parameters'].get('health_goal', [])
-        health_goal = health_goal_list[0] if health_goal_list else ""
-
-        if health_goal in food_recommendations["health_goal"]:
-            recommendations = food_recommendations["health_goal"][health_goal]
-            response = build_response(recommendations, f"Suggestions to help you {health_goal} 💪:", user_id)
-        else:
-            response = {
-                "fulfillmentMessages": [
-                    {
-                        "text": {
-                            "text": ["Could you tell me your health goal again? For example, say 'lose weight' or 'gain muscle'."]
-                        }
-                    }
-                ]
-            }
-        
-    elif intent == "meal.time.recommendation":
-        if meal_time in food_recommendations["meal_time"]:
-            response_text = build_response(food_recommendations["meal_time"][meal_time], f"{meal_time.capitalize()} options ☀️:", user_id)
-        else:
-            response_text = "Is it breakfast, lunch, or dinner time?"
-
-    elif intent == "personalized.recommendation":
-        recent = get_recent_meals(user_id)
-        if food_pref in food_recommendations:
-            choices = [m for m in food_recommendations[food_pref] if m not in recent]
-            response_text = build_response(choices, f"Tailored pick for {food_pref}:")
-        elif weather == "cold":
-            choices = [m for m in food_recommendations["spicy"]["default"] if m not in recent]
-            response_text = build_response(choices, "Cold day special 🔥")
-        elif weather == "hot":
-            choices = [m for m in food_recommendations["cold"] if m not in recent]
-            response_text = build_response(choices, "Cool choices for hot weather ❄️")
-        else:
-            response_text = build_response(food_recommendations["default"], "How about these:")
-    
-    elif intent == "record.recent.meal":
-        if recent_meal:
-            add_recent_meal(user_id, recent_meal)
-            response_text = f"Thanks! I’ve noted that you had {recent_meal}. I’ll avoid recommending it again."        
-        else:
-            response_text = "Got it! Could you repeat the food you just had?"
-    else:
-        response_text = "Sorry, I didn’t understand. Can you try again?"
+    if p["recent_meal"]:
+        g.meal_recorded = user.add_meal(p["recent_meal"])  # 不在菜单里的菜记不了
 
+    response_text = INTENT_HANDLERS.get(intent, handle_unknown)(p, user)
+    # 写库失败就让请求报错（记为 status="error"），不能回复了却丢了记录
+    close_session(user)
     return jsonify({"fulfillmentText": response_text})
 
 if __name__ == "__main__":